@@ -1,20 +1,126 @@
 """Data Handling File for CSC111 Project 2"""
 
+import functools
+import hashlib
+import os
+import pickle
+from typing import Optional
+
+import numpy as np
 import pandas as pd
 import pycountry
 
+# Directory where the cleaned DataFrames are cached between runs, next to this file so that it does not depend on the
+# current working directory
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cache')
+
+# Bump this whenever the output of _clean_data changes, so that stale caches are not reused
+_CACHE_VERSION = 4
+
+# Use pycountry to map iso3 country codes to iso2 country codes. This is built once at import.
+ISO3_TO_ISO2 = {country.alpha_3: country.alpha_2 for country in pycountry.countries}
+
 
 def load_data(
-    airports_data_path: str, routes_data_path: str, gpi_path: str
+    airports_data_path: str,
+    routes_data_path: str,
+    gpi_path: str,
+    cache_dir: Optional[str] = CACHE_DIR,
 ) -> tuple[pd.DataFrame, pd.DataFrame]:
     """Given paths to a valid airport data, routes data and Global Peace Index data, load, clean, and filter the
     datasets and return a tuple of the respective DataFrame objects in the same order.
 
+    The cleaned DataFrames are pickled into cache_dir, keyed on the given paths and the size and modification time of
+    each file, so later runs on the same data skip downloading and parsing entirely. A cache that cannot be read is
+    rebuilt, and if the cache cannot be written (e.g. on a read-only checkout) the DataFrames are returned uncached.
+    Writing a new cache removes the caches of older keys. Pass cache_dir=None to disable the cache.
+
     Preconditions:
         - airports_data_path is a valid path to a valid airports dataset from OpenFlights
         - routess_data_path is a valid path to a valid routes dataset from OpenFlights
         - gpi_path is a valid path to a valid Global Peace Index dataset from Kaggle
     """
+    if cache_dir is None:
+        return _clean_data(airports_data_path, routes_data_path, gpi_path)
+
+    key = _cache_key([airports_data_path, routes_data_path, gpi_path])
+    airports_cache_path = os.path.join(cache_dir, f'{key}_airports.pkl')
+    routes_cache_path = os.path.join(cache_dir, f'{key}_routes.pkl')
+
+    if os.path.exists(airports_cache_path) and os.path.exists(routes_cache_path):
+        try:
+            return pd.read_pickle(airports_cache_path), pd.read_pickle(routes_cache_path)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError, ValueError):
+            # The cache is damaged or was written by an incompatible version of pandas, so rebuild it below
+            pass
+
+    airports_df, routes_df = _clean_data(airports_data_path, routes_data_path, gpi_path)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_pickle(airports_df, airports_cache_path)
+        _write_pickle(routes_df, routes_cache_path)
+        _remove_stale_caches(cache_dir, key)
+    except OSError:
+        # The cache is only an optimization, so data that could not be cached is still returned
+        pass
+
+    return airports_df, routes_df
+
+
+def _write_pickle(df: pd.DataFrame, path: str) -> None:
+    """Pickle df to path, first writing it to a temporary file next to path and then moving it into place, so an
+    interrupted run never leaves a partially written file at path."""
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        df.to_pickle(temporary_path)
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def _remove_stale_caches(cache_dir: str, key: str) -> None:
+    """Remove the cached DataFrames in cache_dir that were written under any key other than the given one, since
+    they belong to data files or a pandas version that have since changed."""
+    for file_name in os.listdir(cache_dir):
+        if file_name.endswith(('_airports.pkl', '_routes.pkl')) and not file_name.startswith(f'{key}_'):
+            os.remove(os.path.join(cache_dir, file_name))
+
+
+def _cache_key(paths: list[str]) -> str:
+    """Return a key identifying the given data files by their path, size and last modification time, along with the
+    version of pandas that pickles them."""
+    digest = hashlib.sha256(f'{_CACHE_VERSION}|{pd.__version__}'.encode())
+    for path in paths:
+        file_stats = os.stat(path)
+        digest.update(
+            f'{os.path.abspath(path)}|{file_stats.st_size}|{file_stats.st_mtime_ns}'.encode()
+        )
+    return digest.hexdigest()[:16]
+
+
+@functools.cache
+def _get_country_to_iso2() -> dict[str, str]:
+    """Return a mapping from OpenFlights country names to iso2 country codes.
+
+    The countries data is downloaded the first time this is called, and every later call in the same process reuses it.
+    """
+    countries_data_url = 'https://raw.githubusercontent.com/jpatokal/openflights/master/data/countries.dat'
+    country_columns = ['Country', 'ISO2', 'DAFIF']
+    countries_df = pd.read_csv(
+        countries_data_url,
+        delimiter=',',
+        names=country_columns,
+        usecols=['Country', 'ISO2'],
+    )
+    return dict(zip(countries_df['Country'], countries_df['ISO2']))
+
+
+def _clean_data(
+    airports_data_path: str, routes_data_path: str, gpi_path: str
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Load, clean, and filter the given datasets without going through the cache. See load_data."""
     # ----------Airports Data----------
     airport_columns = [
         'Airport ID',
@@ -33,30 +139,25 @@ def load_data(
         'Source',
     ]
 
-    airports_df = pd.read_csv(airports_data_path, delimiter=',', names=airport_columns)
-
-    airports_df = airports_df.drop(
-        ['Altitude', 'IATA', 'ICAO', 'DST', 'Tz database time zone', 'Type', 'Source'],
-        axis=1,
-    )
-
-    airports_df = airports_df.astype(
-        {col: 'string' for col in airports_df.select_dtypes(include=['object']).columns}
-    )
-
-    # Add ISO2 Data to airports_df
-    countries_data_url = 'https://raw.githubusercontent.com/jpatokal/openflights/master/data/countries.dat'
-    country_columns = ['Country', 'ISO2', 'DAFIF']
-    countries_df = pd.read_csv(
-        countries_data_url,
+    # Only parse the columns we need, and give the text columns their final dtype at parse time instead of casting them
+    # afterwards
+    airports_df = pd.read_csv(
+        airports_data_path,
         delimiter=',',
-        names=country_columns,
-        usecols=['Country', 'ISO2'],
+        names=airport_columns,
+        usecols=['Airport ID', 'Name', 'City', 'Country', 'Latitude', 'Longitude', 'Timezone'],
+        dtype={
+            'Airport ID': np.int32,
+            'Name': 'string',
+            'City': 'string',
+            'Country': 'string',
+            'Timezone': 'string',
+        },
     )
 
-    airports_df = airports_df.merge(
-        countries_df[['Country', 'ISO2']], on='Country', how='left'
-    )
+    # Add ISO2 Data to airports_df. Looking up one column through a dict is a single hash probe per row, with none of
+    # merge's join machinery
+    airports_df['ISO2'] = airports_df['Country'].map(_get_country_to_iso2())
 
     # ----------Routes Data----------
     routes_columns = [
@@ -71,52 +172,49 @@ def load_data(
         'Equipment',
     ]
 
-    routes_df = pd.read_csv(routes_data_path, delimiter=',', names=routes_columns)
-    # Columns are not needed
-    routes_df = routes_df.drop(
-        ['Airline', 'Airline ID', 'Equipment', 'Codeshare', 'Stops'], axis=1
+    # The routes data uses \N to mean NA, so we parse it as NA directly along with each column's final dtype
+    routes_df = pd.read_csv(
+        routes_data_path,
+        delimiter=',',
+        names=routes_columns,
+        usecols=['Source airport', 'Source airport ID', 'Destination airport', 'Destination airport ID'],
+        na_values=['\\N'],
+        dtype={
+            'Source airport': 'string',
+            'Source airport ID': 'Int64',
+            'Destination airport': 'string',
+            'Destination airport ID': 'Int64',
+        },
     )
-
-    # replace weird formatting where they used \N to mean NA...
-    routes_df = routes_df.replace('\\N', pd.NA)
-
     routes_df.dropna(inplace=True)  # drop all rows with null values
 
-    # Change data types for each column respectively
-    routes_df = routes_df.astype({col: 'Int64' for col in routes_df if 'ID' in col})
-    routes_df = routes_df.astype(
-        {col: 'string' for col in routes_df.select_dtypes(include=['object']).columns}
-    )
+    # Every id is present after dropping nulls, so the nullable wrapper is no longer needed and 32 bits are plenty
+    routes_df = routes_df.astype({'Source airport ID': np.int32, 'Destination airport ID': np.int32})
 
     # ----------Global Peace Index Data----------
-    gpi_df = pd.read_csv(gpi_path)
-    gpi_df = gpi_df.drop(
-        ['Safety and Security', 'Ongoing Conflict', 'Militarian'], axis=1
-    )
+    gpi_df = pd.read_csv(gpi_path, usecols=['Country', 'iso3c', 'Overall Scores', 'year'])
     gpi_df['year'] = gpi_df['year'].astype(int)
     gpi_df = gpi_df[gpi_df['year'] == 2023]
     gpi_df.dropna(inplace=True)
 
-    # Use pycountry to map iso3 country codes to iso2 country codes
-    iso3_to_iso2 = {country.alpha_3: country.alpha_2 for country in pycountry.countries}
-
     # Convert iso3 country codes to iso2
-    gpi_df['ISO2'] = gpi_df['iso3c'].map(iso3_to_iso2)
+    gpi_df['ISO2'] = gpi_df['iso3c'].map(ISO3_TO_ISO2)
 
     # ----------FILTER DATA SO THAT ONLY AIRPORTS IN ROUTES AND AIRPORTS WHOS COUNTRY IS IN GLOBAL PEACE INDEX DATA WILL
     # BE IN AIRPORTS DATAFRAME----------
-    airports_df = airports_df[airports_df['ISO2'].isin(set(gpi_df['ISO2']))]
+    airports_df = airports_df[airports_df['ISO2'].isin(gpi_df['ISO2'])]
 
-    valid_airports = set(routes_df['Source airport ID']).union(
-        set(routes_df['Destination airport ID'])
+    valid_airports = np.union1d(
+        routes_df['Source airport ID'].to_numpy(),
+        routes_df['Destination airport ID'].to_numpy(),
     )
-    airports_df = airports_df[airports_df['Airport ID'].isin(valid_airports)]
+    airports_df = airports_df[np.isin(airports_df['Airport ID'].to_numpy(), valid_airports)]
 
     # ----------APPEND THE GPI INDEX FOR EACH AIRPORT----------
-    airports_df = airports_df.merge(
-        gpi_df[['ISO2', 'Overall Scores']], on='ISO2', how='left'
-    )
-    airports_df.rename(columns={'Overall Scores': 'Global Peace Index'}, inplace=True)
+    iso2_to_gpi = dict(zip(gpi_df['ISO2'], gpi_df['Overall Scores']))
+    airports_df = airports_df.assign(
+        **{'Global Peace Index': airports_df['ISO2'].map(iso2_to_gpi)}
+    ).reset_index(drop=True)
 
     return airports_df, routes_df
 
@@ -129,7 +227,7 @@ if __name__ == '__main__':
     # import python_ta
     #
     # python_ta.check_all(config={
-    #     'extra-imports': ["pandas", "pycountry"],
+    #     'extra-imports': ["functools", "hashlib", "numpy", "os", "pandas", "pickle", "pycountry"],
     #     'allowed-io': [],  # the names (strs) of functions that call print/open/input
     #     'max-line-length': 120
     # })
@@ -2,75 +2,55 @@
 
 from __future__ import annotations
 
+import sys
+from collections import OrderedDict
 from dataclasses import dataclass
-from math import asin, cos, radians, sin, sqrt
-from typing import Any, Union
+from math import asin, sin, sqrt
+from typing import Optional
 
 import networkx as nx
+import numpy as np
 import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
 
 from airports_data import load_data
 
+# The most airports whose shortest path lengths to every vertex an AirportsGraph keeps cached
+PATH_CACHE_SIZE = 64
 
-@dataclass
+
+@dataclass(slots=True)
 class Airport:
-    """DataClass representing information about a given airport.
+    """DataClass representing information about a given airport. Airports are the vertices of an AirportsGraph.
 
     Instance Attributes:
+        - id: The given OpenFlights id of an airport
         - name: The name of an airport
         - city: The city of the location
         - country: The country for the location
         - coordinates: The coordinates of an airport on map using longitude and latitude
         - timezone: The timezone for the location
+        - global_peace_index: The global peace index of the country that the airport is in. We consider this as the
+            "vertex weight."
 
     Representation Invariants:
+        - self.id >= 0
         - self.name != ''
         - self.coordinates != tuple()
         - self.city != ''
         - self.country != ''
         - self.timezone != ''
+        - self.global_peace_index >= 0
     """
 
+    id: int
     name: str
     city: str
     country: str
     coordinates: tuple[float, float]
     timezone: str
-
-
-class _AirportVertex:
-    """Airport Vertex Class
-
-    Instance Attributes:
-        - id: The given OpenFlights id of an airport
-        - item: The characteristics of the airport vertex
-        - global_peace_index: The global peace index of the country that the airport is in. We consider this as the
-            "vertex weight."
-        - neighbours: The airport vertices that are adjacent to this vertex, and their corresponding edge weights.
-
-    Representation Invariants:
-        - self.id >= 0
-        - self.global_peace_index >= 0
-        - self not in self.neighbours
-        - all(self in u.neighbours for u in self.neighbours)
-    """
-
-    id: int
-    item: Airport
     global_peace_index: float
-    neighbours: dict[_AirportVertex, Union[int, float]]
-
-    def __init__(
-        self, airport_id: int, item: Airport, global_peace_index: float
-    ) -> None:
-        self.id = airport_id
-        self.item = item
-        self.global_peace_index = global_peace_index
-        self.neighbours = {}
-
-    def get_degree(self) -> int:
-        """Return the degree of this vertex"""
-        return len(self.neighbours)
 
 
 class AirportsGraph:
@@ -78,22 +58,91 @@ class AirportsGraph:
 
     # Private Instance Attributes:
     #     - _vertices:
-    #         A collection of the vertices contained in this graph.
-    #         Maps airport id to _Vertex object.
-
-    _vertices: dict[Any, _AirportVertex]
+    #         The airports contained in this graph, ordered by their dense vertex index.
+    #     - _ids:
+    #         The airport ids of the vertices in this graph, ordered by their dense vertex index.
+    #     - _index:
+    #         Maps airport id to the dense vertex index of that airport.
+    #     - _radians, _cos_latitudes:
+    #         The (latitude, longitude) of every vertex, converted to radians once, as one contiguous array of shape
+    #         (number of vertices, 2) ordered by vertex index, and the cosine of each of those latitudes. These are
+    #         None while out of date.
+    #     - _name_index, _city_index:
+    #         Map each airport name and each city to the vertex indices of the airports with that name or in that
+    #         city, in increasing order.
+    #     - _edges:
+    #         The undirected edges of this graph while it is being built. Maps a pair of vertex indices (i, j) with
+    #         i < j to the distance of the route between them. This is released (set to None) once the CSR arrays
+    #         are built from it, and rebuilt from them when the graph changes again.
+    #     - _row_ptr, _col_ind, _weights:
+    #         The adjacency of this graph in compressed sparse row (CSR) form. The neighbours of the vertex with
+    #         index i are _col_ind[_row_ptr[i]:_row_ptr[i + 1]], sorted by index, and the corresponding edge
+    #         weights are _weights[_row_ptr[i]:_row_ptr[i + 1]]. These are built from _edges when needed and are
+    #         None while out of date. Exactly one of _edges and _row_ptr is None at any time.
+    #     - _components:
+    #         Maps each vertex index to the label of its connected component, or None while out of date.
+    #     - _path_distances:
+    #         Maps a vertex index to the array of shortest path lengths from that vertex to every vertex, for the
+    #         PATH_CACHE_SIZE vertices that queries most recently started from, least recently used first.
+    #     - _country_gpi:
+    #         Maps each country to the Global Peace Index of the first airport added in that country.
+    #     - _rankings:
+    #         Maps (airport ids, max_out_size) to the result of an earlier call to rank_airports with those arguments.
+
+    _vertices: list[Airport]
+    _ids: list[int]
+    _index: dict[int, int]
+    _radians: Optional[np.ndarray]
+    _cos_latitudes: Optional[np.ndarray]
+    _name_index: dict[str, list[int]]
+    _city_index: dict[str, list[int]]
+    _edges: Optional[dict[tuple[int, int], int]]
+    _row_ptr: Optional[np.ndarray]
+    _col_ind: Optional[np.ndarray]
+    _weights: Optional[np.ndarray]
+    _components: Optional[np.ndarray]
+    _path_distances: OrderedDict[int, np.ndarray]
+    _country_gpi: dict[str, float]
+    _rankings: dict[tuple[frozenset[int], int], list[int]]
 
     def __init__(self) -> None:
-        self._vertices = {}
-
-    def add_vertex(
-        self, airport_id: int, item: Airport, global_peace_index: float
-    ) -> None:
-        """Add an airport to the graph, mapping the airport id to the vertex object"""
-        if airport_id not in self._vertices:
-            self._vertices[airport_id] = _AirportVertex(
-                airport_id, item, global_peace_index
-            )
+        self._vertices = []
+        self._ids = []
+        self._index = {}
+        self._radians = None
+        self._cos_latitudes = None
+        self._name_index = {}
+        self._city_index = {}
+        self._edges = {}
+        self._row_ptr = None
+        self._col_ind = None
+        self._weights = None
+        self._components = None
+        self._path_distances = OrderedDict()
+        self._country_gpi = {}
+        self._rankings = {}
+
+    def add_vertex(self, airport: Airport) -> None:
+        """Add an airport to the graph, mapping the airport id to its vertex index"""
+        self.add_vertices([airport])
+
+    def add_vertices(self, airports: list[Airport]) -> None:
+        """Add each of the given airports to the graph in order. This does the same as calling add_vertex on each
+        airport, but only marks the cached data out of date once."""
+        num_vertices = len(self._vertices)
+        for airport in airports:
+            if airport.id not in self._index:
+                index = len(self._vertices)
+                self._index[airport.id] = index
+                self._name_index.setdefault(airport.name, []).append(index)
+                self._city_index.setdefault(airport.city, []).append(index)
+                self._country_gpi.setdefault(airport.country, airport.global_peace_index)
+                self._vertices.append(airport)
+                self._ids.append(airport.id)
+
+        if len(self._vertices) > num_vertices:
+            self._radians = None
+            self._clear_cache()
 
     def add_edge(self, source_id: int, destination_id: int) -> None:
         """Add an adjacent airport and its distance to this vertex. Since the graph is not oriented, we also add the
@@ -102,105 +151,243 @@ class AirportsGraph:
         Preconditions:
             - source_id != destination_id
         """
-        if source_id in self._vertices and destination_id in self._vertices:
-            # Since the graph is not oriented, the edges will be symmetric.
-            source_vertex = self._vertices[source_id]
-            destination_vertex = self._vertices[destination_id]
+        if source_id in self._index and destination_id in self._index:
+            # Since the graph is not oriented, each edge is stored once under its sorted pair of indices.
+            edge = self._edge_key(source_id, destination_id)
 
             # case if edge already exists, we don't need to recalculate distance to improve runtime.
-            if (
-                source_vertex in destination_vertex.neighbours
-                or destination_vertex in source_vertex.neighbours
-            ):
-                return
-            else:
-                distance = self.get_earth_distance(source_id, destination_id)
-
-                source_vertex.neighbours[destination_vertex] = distance
-                destination_vertex.neighbours[source_vertex] = distance
+            edges = self._get_edge_dict()
+            if edge not in edges:
+                edges[edge] = self.get_earth_distance(source_id, destination_id)
+                self._clear_cache()
         else:
             raise KeyError("Source ID or Destination ID do not exist in this graph.")
 
+    def add_edges(self, source_ids: np.ndarray, destination_ids: np.ndarray) -> None:
+        """Add an edge between each pair of airports source_ids[i] and destination_ids[i]. This does the same as
+        calling add_edge on every pair, but computes the distances of all the new edges at once.
+        Raise a KeyError if any of the ids do not exist in this graph.
+
+        Preconditions:
+            - len(source_ids) == len(destination_ids)
+            - all(source_ids[i] != destination_ids[i] for i in range(len(source_ids)))
+        """
+        # Look up the vertex index of every id at once; get_indexer marks ids that are not in the graph with -1.
+        id_index = pd.Index(self._ids)
+        sources = id_index.get_indexer(source_ids)
+        destinations = id_index.get_indexer(destination_ids)
+        if (sources < 0).any() or (destinations < 0).any():
+            raise KeyError("Source ID or Destination ID do not exist in this graph.")
+
+        # Each edge is stored once under its sorted pair of indices, so collapse repeated routes before computing
+        # any distances. Encoding each pair as a single integer keeps this a flat sort.
+        num_vertices = len(self._vertices)
+        keys = np.unique(
+            np.minimum(sources, destinations).astype(np.int64) * num_vertices + np.maximum(sources, destinations)
+        )
+        pairs = np.stack(np.divmod(keys, num_vertices), axis=1)
+        radians, cos_latitudes = self._get_geometry()
+        distances = _haversine_distances(
+            radians[pairs[:, 0]], radians[pairs[:, 1]], cos_latitudes[pairs[:, 0]], cos_latitudes[pairs[:, 1]]
+        )
+
+        # The distance of an edge only depends on its endpoints, so overwriting an existing edge keeps its value.
+        self._get_edge_dict().update(zip(map(tuple, pairs.tolist()), distances.tolist()))
+        self._clear_cache()
+
     def get_neighbours(self, airport_id: int) -> set[int]:
         """Return a set of airport ids that are adjacent to the vertex corresponding to the given airport id.
         If the id does not exist, raise a Value Error.
         """
-        if airport_id in self._vertices:
-            return {neighbour.id for neighbour in self._vertices[airport_id].neighbours}
+        if airport_id in self._index:
+            row_ptr, col_ind, _ = self._get_csr()
+            index = self._index[airport_id]
+            return {
+                self._ids[neighbour]
+                for neighbour in col_ind[row_ptr[index]:row_ptr[index + 1]].tolist()
+            }
         else:
             raise ValueError("The given airport id does not exist.")
 
+    def get_edges(self) -> np.ndarray:
+        """Return the edges of this graph as an array of shape (number of edges, 2), where each row holds the airport
+        ids of the two endpoints of an edge. Each undirected edge appears exactly once.
+        """
+        row_ptr, col_ind, _ = self._get_csr()
+        sources = np.repeat(np.arange(len(self._ids)), np.diff(row_ptr))
+
+        # Every edge is stored in both directions, so keep only the copy in the row of its smaller endpoint.
+        mask = sources < col_ind
+        ids = np.asarray(self._ids)
+        return np.stack([ids[sources[mask]], ids[col_ind[mask]]], axis=1)
+
+    def get_degree(self, airport_id: int) -> int:
+        """Return the degree of the vertex corresponding to the given airport id"""
+        row_ptr, _, _ = self._get_csr()
+        index = self._index[airport_id]
+        return int(row_ptr[index + 1] - row_ptr[index])
+
+    def _clear_cache(self) -> None:
+        """Mark everything derived from the vertices and edges of this graph as out of date"""
+        # The CSR arrays may be the only copy of the edges, so bring the edge dict back before dropping them.
+        self._get_edge_dict()
+        self._row_ptr = None
+        self._components = None
+        self._path_distances = OrderedDict()
+        self._rankings = {}
+
+    def _edge_key(self, id1: int, id2: int) -> tuple[int, int]:
+        """Return the key of the edge between the given two airports in the edge dict"""
+        index1 = self._index[id1]
+        index2 = self._index[id2]
+        return (index1, index2) if index1 < index2 else (index2, index1)
+
+    def _get_geometry(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return the (radians, cos_latitudes) arrays of this graph, gathering the coordinates out of the airports if
+        they are out of date.
+
+        radians holds the coordinates of every vertex in radians, with shape (number of vertices, 2), and
+        cos_latitudes holds the cosine of every vertex's latitude, since the haversine formula needs it for both ends
+        of every edge.
+        """
+        if self._radians is None:
+            self._radians = np.radians(
+                np.array([airport.coordinates for airport in self._vertices], dtype=np.float64).reshape(-1, 2)
+            )
+            self._cos_latitudes = np.cos(self._radians[:, 0])
+
+        return self._radians, self._cos_latitudes
+
+    def _get_edge_dict(self) -> dict[tuple[int, int], int]:
+        """Return self._edges, rebuilding it from the CSR arrays if it was released"""
+        if self._edges is None:
+            row_ptr, col_ind, weights = self._row_ptr, self._col_ind, self._weights
+            sources = np.repeat(np.arange(len(row_ptr) - 1, dtype=np.int32), np.diff(row_ptr))
+
+            # Every edge is stored in both directions, so keep only the copy in the row of its smaller endpoint.
+            mask = sources < col_ind
+            self._edges = dict(
+                zip(zip(sources[mask].tolist(), col_ind[mask].tolist()), weights[mask].tolist())
+            )
+
+        return self._edges
+
+    def _get_csr(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the (row_ptr, col_ind, weights) CSR arrays of this graph, building them from self._edges if
+        they are out of date. Once built, they are the only copy of the edges, so self._edges is released."""
+        if self._row_ptr is None:
+            num_vertices = len(self._ids)
+            # Vertex indices fit comfortably in 32 bits, and distances in kilometers in 16 bits since no two points
+            # on Earth are more than about 20 000 km apart. This keeps every array traversed below small.
+            pairs = np.array(list(self._edges), dtype=np.int32).reshape(-1, 2)
+            distances = np.fromiter(
+                self._edges.values(), dtype=np.int16, count=len(self._edges)
+            )
+
+            # Since the graph is not oriented, every edge appears in the rows of both of its endpoints.
+            sources = np.concatenate([pairs[:, 0], pairs[:, 1]])
+            targets = np.concatenate([pairs[:, 1], pairs[:, 0]])
+            order = np.lexsort((targets, sources))
+
+            row_ptr = np.zeros(num_vertices + 1, dtype=np.int32)
+            row_ptr[1:] = np.cumsum(np.bincount(sources, minlength=num_vertices))
+
+            self._row_ptr = row_ptr
+            self._col_ind = targets[order]
+            self._weights = np.concatenate([distances, distances])[order]
+            self._edges = None
+
+        return self._row_ptr, self._col_ind, self._weights
+
     def get_earth_distance(self, airport_id1: int, airport_id2: int) -> int:
         """Return the rounded integer distance (in kilometers) between the given two airports
 
         Credits to Geeks4Geeks for inspiration.
         """
-        airport1_coords = self._vertices[airport_id1].item.coordinates
-        airport2_coords = self._vertices[airport_id2].item.coordinates
-
-        lat1 = radians(airport1_coords[0])
-        lat2 = radians(airport2_coords[0])
-        long1 = radians(airport1_coords[1])
-        long2 = radians(airport2_coords[1])
+        radians, cos_latitudes = self._get_geometry()
+        index1, index2 = self._index[airport_id1], self._index[airport_id2]
+        lat1, long1 = radians[index1].tolist()
+        lat2, long2 = radians[index2].tolist()
 
         # Reversine formula given by Geeks4Geeks
         dlon = long2 - long1
         dlat = lat2 - lat1
-        a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+        a = sin(dlat / 2) ** 2 + float(cos_latitudes[index1] * cos_latitudes[index2]) * sin(dlon / 2) ** 2
 
         c = 2 * asin(sqrt(a))
         r = 6371
 
         return int(round(c * r, 0))
 
-    def is_connected(
-        self, source_id: int, destination_id: int, visited: set[int]
-    ) -> bool:
-        """Check if two vertices are connected"""
-        if visited is set():
-            visited = set()
+    def is_connected(self, source_id: int, destination_id: int) -> bool:
+        """Check if two vertices are connected. If the source id does not exist, raise a ValueError, and if the
+        destination id does not exist, return False.
 
+        Since two vertices are connected exactly when they are in the same connected component, this is a single
+        comparison of the cached component labels.
+        """
         if source_id == destination_id:
             return True
+        elif source_id not in self._index:
+            raise ValueError("The given airport id does not exist.")
+        elif destination_id not in self._index:
+            return False
 
-        visited.add(source_id)
+        components = self._get_components()
+        return bool(
+            components[self._index[source_id]]
+            == components[self._index[destination_id]]
+        )
 
-        for neighbour in self.get_neighbours(source_id):
-            if neighbour not in visited:
-                if self.is_connected(neighbour, destination_id, visited):
-                    return True
+    def _get_components(self) -> np.ndarray:
+        """Return an array mapping each vertex index to the label of its connected component, computing the labels
+        if they are out of date.
 
-        return False
+        The labelling runs in SciPy's compiled graph routines directly on our CSR arrays, so it never loops in Python.
+        """
+        if self._components is None:
+            _, self._components = connected_components(self._get_adjacency_matrix(), directed=False)
+
+        return self._components
 
     def get_distance(self, id1: int, id2: int) -> float:
         """Return the distance between the corresponding vertices with id1 and id2.
         Raise a ValueError if either id does not exist."""
-        if id1 in self._vertices and id2 in self._vertices:
-            v1 = self._vertices[id1]
-            v2 = self._vertices[id2]
-            return v1.neighbours.get(v2, 0)
+        if id1 in self._index and id2 in self._index:
+            # Each CSR row is sorted by vertex index, so the edge, if any, is found by binary search in the row.
+            row_ptr, col_ind, weights = self._get_csr()
+            index1, index2 = self._index[id1], self._index[id2]
+            start, end = row_ptr[index1], row_ptr[index1 + 1]
+            position = start + int(np.searchsorted(col_ind[start:end], index2))
+            if position < end and col_ind[position] == index2:
+                return int(weights[position])
+            else:
+                return 0
         else:
             raise ValueError("No distance given between these two airports.")
 
     def get_airport_names_from_id(self, airport_ids: list[int]) -> list[str]:
         """Return the corresponding airport names given a list of airport ids"""
-        return [self._vertices[airport].item.name for airport in airport_ids]
+        return [self._vertices[self._index[airport]].name for airport in airport_ids]
 
     def get_airport_id_from_names(self, airport_names: list[str]) -> list[int]:
         """Return the corresponding airport ids given a list of airport names"""
-        return [
-            airport_id
-            for airport_id, airport in self._vertices.items()
-            if airport.item.name in airport_names
-        ]
+        indices = set()
+        for name in airport_names:
+            indices.update(self._name_index.get(name, []))
+        return [self._ids[index] for index in sorted(indices)]
+
+    def get_airport_ids_from_city(self, city: str) -> list[int]:
+        """Return the ids of the airports in the given city"""
+        return [self._ids[index] for index in self._city_index.get(city, [])]
 
     def __contains__(self, airport_id: int) -> bool:
         """Check if an airport is in the graph"""
-        return airport_id in self._vertices
+        return airport_id in self._index
 
     def __iter__(self) -> iter:
         """Iterate through the airport objects"""
-        return iter(self._vertices.values())
+        return iter(self._vertices)
 
     def __len__(self) -> int:
         """Get the number of vertices in the graph"""
@@ -215,115 +402,128 @@ class AirportsGraph:
         This code has been inspired by the method built in exercise3/exercise4
         """
 
-        graph_nx = nx.Graph()
-        for v in self._vertices.values():
-            graph_nx.add_node(
-                v.item.name,
-                latitude=v.item.coordinates[0],
-                longitude=v.item.coordinates[1],
-                id=v.id,
-                global_piece_index=v.global_peace_index,
-                country=v.item.country,
-            )
-
-            for u in v.neighbours:
-                if graph_nx.number_of_nodes() < max_vertices:
-                    graph_nx.add_node(
-                        u.item.name,
-                        latitude=u.item.coordinates[0],
-                        longitude=u.item.coordinates[1],
-                        id=u.id,
-                        global_piece_index=u.global_peace_index,
-                        country=u.item.country,
-                    )
-
-                if u.item.name in graph_nx.nodes:
-                    distance = v.neighbours[u]
-                    graph_nx.add_edge(v.item.name, u.item.name, weight=distance)
-
-            if graph_nx.number_of_nodes() >= max_vertices:
-                break
+        # Vertices are keyed by name in the networkx graph, so airports sharing a name share a node. Keep the
+        # airports with the first max_vertices distinct names, in vertex order.
+        names = pd.Series([v.name for v in self._vertices], dtype=object)
+        top_names = names.drop_duplicates().iloc[:max(max_vertices, 0)]
+        selected = names.isin(top_names).to_numpy()
+
+        # Every edge is stored in the rows of both its endpoints, so keep the copy in the row of its smaller endpoint,
+        # along with any route from an airport to itself, and only the edges between two selected airports.
+        row_ptr, col_ind, weights = self._get_csr()
+        sources = np.repeat(np.arange(len(self._vertices)), np.diff(row_ptr))
+        kept = (sources <= col_ind) & selected[sources] & selected[col_ind]
+        edges_df = pd.DataFrame({
+            'source': names.to_numpy()[sources[kept]],
+            'target': names.to_numpy()[col_ind[kept]],
+            'weight': weights[kept].astype(np.int64),
+        })
+
+        graph_nx = nx.from_pandas_edgelist(edges_df, 'source', 'target', 'weight')
+        graph_nx.add_nodes_from(top_names)
+
+        # Each node takes the attributes of the last selected airport with its name.
+        airports = [v for v, is_selected in zip(self._vertices, selected.tolist()) if is_selected]
+        for attribute, values in [
+            ('latitude', [v.coordinates[0] for v in airports]),
+            ('longitude', [v.coordinates[1] for v in airports]),
+            ('id', [v.id for v in airports]),
+            ('global_piece_index', [v.global_peace_index for v in airports]),
+            ('country', [v.country for v in airports]),
+        ]:
+            nx.set_node_attributes(graph_nx, dict(zip((v.name for v in airports), values)), attribute)
 
         return graph_nx
 
     def get_neighbour_within_dist(self, airport_id: int, max_distance: int) -> set:
         """Get adjacent neighbours that are within max_distance"""
-        curr_airport_vertex = self._vertices[airport_id]
-        return {
-            neighbour.id
-            for neighbour in curr_airport_vertex.neighbours
-            if curr_airport_vertex.neighbours[neighbour] <= max_distance
-        }
-
-    def dfs_for_distance(
-        self, airport_id: int, max_distance: int, airports_in_dist: set[int]
-    ) -> None:
-        """Use Depth First Search Algorithm to find all aiports within a distance."""
-        if max_distance < 0 or airport_id in airports_in_dist:
-            return
-        else:
-            airports_in_dist.add(airport_id)
-            for neighbour, edge_weight in self._vertices[airport_id].neighbours.items():
-                self.dfs_for_distance(
-                    neighbour.id, int(max_distance - edge_weight), airports_in_dist
-                )
+        row_ptr, col_ind, weights = self._get_csr()
+        index = self._index[airport_id]
+        start, end = row_ptr[index], row_ptr[index + 1]
+        close = col_ind[start:end][weights[start:end] <= max_distance]
+        return {self._ids[neighbour] for neighbour in close.tolist()}
 
     def get_connected_within_dist(self, airport_id: int, max_distance: int) -> set[int]:
         """Get any connected vertex from the airport corresponding to airport_id where there exists a path that is
         less than or equal to max_distance distance."""
-        if airport_id not in self._vertices:
+        if airport_id not in self._index:
             return set()
         else:
-            airports_in_dist = set()
-            self.dfs_for_distance(airport_id, max_distance, airports_in_dist)
-            return airports_in_dist
+            within_dist = self._get_path_distances(airport_id) <= max_distance
+            return {self._ids[index] for index in np.flatnonzero(within_dist).tolist()}
+
+    def _get_path_distances(self, airport_id: int) -> np.ndarray:
+        """Return an array mapping each vertex index to the length of the shortest path to it from the airport
+        corresponding to airport_id, or infinity if there is no such path.
+
+        The distances are found with Dijkstra's algorithm, run by SciPy over our CSR arrays, and cached until the
+        graph changes for the PATH_CACHE_SIZE most recently queried airports, so the cache stays bounded.
+        """
+        index = self._index[airport_id]
+        if index in self._path_distances:
+            self._path_distances.move_to_end(index)
+        else:
+            self._path_distances[index] = dijkstra(self._get_adjacency_matrix(), directed=False, indices=index)
+            if len(self._path_distances) > PATH_CACHE_SIZE:
+                self._path_distances.popitem(last=False)
+
+        return self._path_distances[index]
+
+    def _get_adjacency_matrix(self) -> csr_matrix:
+        """Return the weighted adjacency matrix of this graph as a SciPy sparse matrix sharing our CSR arrays"""
+        row_ptr, col_ind, weights = self._get_csr()
+        num_vertices = len(self._ids)
+        return csr_matrix((weights, col_ind, row_ptr), shape=(num_vertices, num_vertices))
 
     def get_close_airports_adjacent(
         self, airport_ids: list[int], max_distance: int
     ) -> set:
         """Return a set of airport ids that are adjacent to every airport in airport_ids within max_distance.
+        If airport_ids is empty or any of its airports is not in this graph, return an empty set.
 
         Preconditions:
-            - all({airport_id in self._vertices for airport_id in airport_ids})
+            - all({airport_id in self for airport_id in airport_ids})
         """
-        valid_ids = [aid for aid in airport_ids if aid in self._vertices]
-
-        if not valid_ids:
+        index = self._index
+        if not airport_ids or not all(airport_id in index for airport_id in airport_ids):
             return set()
-        # Compute the neighbours that are at most max_distance far for the first id.
-        close_airports = self.get_neighbour_within_dist(airport_ids[0], max_distance)
 
-        # Then we can find the intersection of all airports that are at most max_distance away from all airports.
-        for airport_id in airport_ids[1:]:
-            close_airports = close_airports.intersection(
-                self.get_neighbour_within_dist(airport_id, max_distance)
-            )
+        # Start from the airport with the fewest neighbours, and keep only the candidates that are also close to
+        # each of the others, stopping as soon as none are left.
+        row_ptr, col_ind, weights = self._get_csr()
+        rows = sorted(
+            (row_ptr[index[airport_id]:index[airport_id] + 2].tolist() for airport_id in airport_ids),
+            key=lambda bounds: bounds[1] - bounds[0],
+        )
+        close_airports = None
+        for start, end in rows:
+            close = {
+                neighbour
+                for neighbour, distance in zip(col_ind[start:end].tolist(), weights[start:end].tolist())
+                if distance <= max_distance
+            }
+            close_airports = close if close_airports is None else close_airports & close
+            if not close_airports:
+                break
 
-        return close_airports
+        return {self._ids[neighbour] for neighbour in close_airports}
 
     def get_close_airports_connected(
         self, airport_ids: list[int], max_distance: int
     ) -> set:
         """Return a set of airport ids that are connected to every airport in airport_ids. Each of these airports must
-         have a route/path within max_distance far.
+         have a route/path within max_distance far. If airport_ids is empty or any of its airports is not in this
+         graph, return an empty set.
 
         Preconditions:
-            - all({airport_id in self._vertices for airport_id in airport_ids})
+            - all({airport_id in self for airport_id in airport_ids})
         """
-        valid_ids = [aid for aid in airport_ids if aid in self._vertices]
-
-        if not valid_ids:
+        if not airport_ids or not all(airport_id in self._index for airport_id in airport_ids):
             return set()
-        # Compute the neighbours that are at most max_distance far for the first id.
-        close_airports = self.get_connected_within_dist(airport_ids[0], max_distance)
-
-        # Then we can find the intersection of all airports that are at most max_distance away from all airports.
-        for airport_id in airport_ids[1:]:
-            close_airports = close_airports.intersection(
-                self.get_connected_within_dist(airport_id, max_distance)
-            )
 
-        return close_airports
+        # An airport is close to all of them exactly when its longest shortest path from any of them is short enough.
+        farthest = np.max([self._get_path_distances(airport_id) for airport_id in airport_ids], axis=0)
+        return {self._ids[index] for index in np.flatnonzero(farthest <= max_distance).tolist()}
 
     def rank_airports(self, airport_ids: set[int], max_out_size: int) -> list[int]:
         """Rank the airports by their global peace index and number of connections.
@@ -331,36 +531,61 @@ class AirportsGraph:
         Then, rank each country by their global peace index, and finally rank by combining the two.
 
         Preconditions:
-            - all({airport_id in self._vertices for airport_id in airport_ids})
+            - all({airport_id in self for airport_id in airport_ids})
         """
+        key = (frozenset(airport_ids), max_out_size)
+        if key not in self._rankings:
+            self._rankings[key] = self._compute_ranking(airport_ids, max_out_size)
+
+        return list(self._rankings[key])
+
+    def _compute_ranking(self, airport_ids: set[int], max_out_size: int) -> list[int]:
+        """Rank the given airports without going through the cache. See rank_airports."""
+        # Sort by degree, read straight off the CSR row pointers, with a stable argsort so that ties keep their order
+        row_ptr, _, _ = self._get_csr()
+        given_ids = list(airport_ids)
+        degrees = np.diff(row_ptr)[[self._index[airport_id] for airport_id in given_ids]]
+
+        # Bucketing the airports in order of degree leaves each country's airports sorted by degree
         countries = {}
-        for airport_id in airport_ids:
-            airport_vertex = self._vertices[airport_id]
-            country = airport_vertex.item.country
+        for i in np.argsort(-degrees, kind='stable').tolist():
+            airport_id = given_ids[i]
+            country = self._vertices[self._index[airport_id]].country
             if country not in countries:
                 countries[country] = []
-            countries[country].append(airport_id)
-
-        for country in countries:
-            countries[country] = sorted(
-                airport_ids,
-                key=lambda given_id: self._vertices[given_id].get_degree(),
-                reverse=True,
-            )[:max_out_size]
+            if len(countries[country]) < max_out_size:
+                countries[country].append(airport_id)
 
         # Rank the countries by their Global Peace Index and merge the lists together
         ranked_airports = []
-        for country in sorted(
-            countries,
-            key=lambda given_id: (
-                self._vertices[countries[given_id][0]].global_peace_index
-            ),
-        ):
+        for country in sorted(countries, key=self._country_gpi.__getitem__):
             ranked_airports += countries[country]
 
         return ranked_airports[:max_out_size]
 
 
+def _haversine_distances(
+    radians1: np.ndarray, radians2: np.ndarray, cos_latitudes1: np.ndarray, cos_latitudes2: np.ndarray
+) -> np.ndarray:
+    """Return the rounded integer distances (in kilometers) between each pair of (latitude, longitude) rows of
+    radians1 and radians2, given in radians, where cos_latitudes1 and cos_latitudes2 hold the cosines of their
+    latitudes. This is the same formula as AirportsGraph.get_earth_distance, over whole arrays.
+
+    Preconditions:
+        - radians1.shape == radians2.shape
+        - radians1.shape[1] == 2
+        - cos_latitudes1.shape == cos_latitudes2.shape == (radians1.shape[0],)
+    """
+    lat1, long1 = radians1.T
+    lat2, long2 = radians2.T
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + cos_latitudes1 * cos_latitudes2 * np.sin((long2 - long1) / 2) ** 2
+    c = 2 * np.arcsin(np.sqrt(a))
+    r = 6371
+
+    return np.rint(c * r).astype(np.int32)
+
+
 def load_airports_graph(df1: pd.DataFrame, df2: pd.DataFrame) -> AirportsGraph:
     """Given two pandas DataFrame objects airports and routes, build and return an airport graph using the data
 
@@ -369,31 +594,54 @@ def load_airports_graph(df1: pd.DataFrame, df2: pd.DataFrame) -> AirportsGraph:
     - df2 is a valid routes dataframe with the routes between airports that exist in df1
 
     Note:
-        Our implementation may look a bit unorganized due to indexing the rows, but this is a faster alternative to
-        iterating through dataframe objects.
+        We pull each column we need out of the dataframes once and zip over them, which is a faster alternative to
+        iterating through dataframe objects row by row.
     """
 
     airports_graph = AirportsGraph()
 
-    # Create vertices using itertuples instead of to_dict
-    for row in df1.itertuples(index=False):
-        airport_id = row[0]  # This corresponds to 'Airport ID'
-        airport_item = Airport(row[1], row[2], row[3], (row[4], row[5]), row[6])
-        airport_gpi = row[8]
-        airports_graph.add_vertex(airport_id, airport_item, airport_gpi)
-
-    # Create edges for routes using itertuples
-    for row in df2.itertuples(index=False):
-        source_airport_id = row[1]  # This corresponds to 'Source airport ID'
-        # This corresponds to 'Destination airport ID'
-        destination_airport_id = row[3]
-
-        # Ensure both airports exist in the airports dataframe
-        if (
-            source_airport_id in airports_graph
-            and destination_airport_id in airports_graph
-        ):
-            airports_graph.add_edge(source_airport_id, destination_airport_id)
+    vertex_columns = [
+        'Airport ID',
+        'Name',
+        'City',
+        'Country',
+        'Latitude',
+        'Longitude',
+        'Timezone',
+        'Global Peace Index',
+    ]
+
+    # Create all vertices at once from the columns, hoisted out of the dataframe once
+    airport_ids, names, cities, countries, latitudes, longitudes, timezones, airport_gpis = (
+        df1[column].tolist() for column in vertex_columns
+    )
+
+    # Only a few hundred distinct countries and timezones are shared by thousands of airports, so intern them to keep
+    # one copy of each string and make comparing them (e.g. as dict keys in rank_airports) a pointer check
+    countries = list(map(sys.intern, countries))
+    timezones = list(map(sys.intern, timezones))
+    airports_graph.add_vertices(
+        list(
+            map(
+                Airport,
+                airport_ids,
+                names,
+                cities,
+                countries,
+                zip(latitudes, longitudes),
+                timezones,
+                airport_gpis,
+            )
+        )
+    )
+
+    # Create edges for all routes at once, keeping only the routes where both airports exist in the airports dataframe
+    source_ids = df2['Source airport ID'].to_numpy()
+    destination_ids = df2['Destination airport ID'].to_numpy()
+    airport_ids = df1['Airport ID'].to_numpy()
+    in_graph = np.isin(source_ids, airport_ids) & np.isin(destination_ids, airport_ids)
+
+    airports_graph.add_edges(source_ids[in_graph], destination_ids[in_graph])
 
     return airports_graph
 
@@ -406,7 +654,8 @@ if __name__ == "__main__":
     # import python_ta
 
     # python_ta.check_all(config={
-    #    'extra-imports': ["pandas", "networkx", "visualizer", "math", "airports_data"],
+    #    'extra-imports': ["pandas", "networkx", "numpy", "sys", "collections", "scipy.sparse",
+    #                      "scipy.sparse.csgraph", "visualizer", "math", "airports_data"],
     #    'allowed-io': [],  # the names (strs) of functions that call print/open/input
     #    'max-line-length': 120
     # })
@@ -0,0 +1,90 @@
+"""Tests for the on-disk cache of cleaned DataFrames in airports_data.py"""
+
+import os
+
+import pandas as pd
+import pytest
+
+import airports_data
+
+
+@pytest.fixture
+def data_paths(tmp_path) -> list[str]:
+    """Return the paths of three stand-in data files, which the cache key stats but never parses here"""
+    paths = []
+    for name in ['airports.dat', 'routes.dat', 'gpi.csv']:
+        path = tmp_path / name
+        path.write_text(name)
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def clean_calls(monkeypatch) -> list[tuple[str, str, str]]:
+    """Replace _clean_data with one that records its calls and returns small fixed DataFrames, so no test parses
+    or downloads the real datasets"""
+    calls = []
+
+    def clean_data(airports_data_path: str, routes_data_path: str, gpi_path: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+        calls.append((airports_data_path, routes_data_path, gpi_path))
+        airports_df = pd.DataFrame({'Airport ID': [1, 2]})
+        routes_df = pd.DataFrame({'Source airport ID': [1], 'Destination airport ID': [2]})
+        return airports_df, routes_df
+
+    monkeypatch.setattr(airports_data, '_clean_data', clean_data)
+    return calls
+
+
+def _cache_files(cache_dir) -> list[str]:
+    """Return the sorted names of the files in cache_dir"""
+    return sorted(os.listdir(cache_dir))
+
+
+def test_cache_miss_then_hit(tmp_path, data_paths, clean_calls) -> None:
+    """The first load cleans the data and writes the cache, and the second load reads it back without cleaning"""
+    cache_dir = tmp_path / 'cache'
+    first = airports_data.load_data(*data_paths, cache_dir=str(cache_dir))
+    assert len(clean_calls) == 1
+    key = airports_data._cache_key(data_paths)
+    assert _cache_files(cache_dir) == [f'{key}_airports.pkl', f'{key}_routes.pkl']
+
+    second = airports_data.load_data(*data_paths, cache_dir=str(cache_dir))
+    assert len(clean_calls) == 1
+    for expected, actual in zip(first, second):
+        pd.testing.assert_frame_equal(expected, actual)
+
+
+def test_corrupt_cache_is_rebuilt(tmp_path, data_paths, clean_calls) -> None:
+    """A cache file that cannot be unpickled is ignored, and the data is cleaned and cached again"""
+    cache_dir = tmp_path / 'cache'
+    airports_data.load_data(*data_paths, cache_dir=str(cache_dir))
+    key = airports_data._cache_key(data_paths)
+    (cache_dir / f'{key}_airports.pkl').write_bytes(b'not a pickle')
+
+    airports_df, _ = airports_data.load_data(*data_paths, cache_dir=str(cache_dir))
+    assert len(clean_calls) == 2
+    assert airports_df['Airport ID'].tolist() == [1, 2]
+    pd.testing.assert_frame_equal(pd.read_pickle(cache_dir / f'{key}_airports.pkl'), airports_df)
+
+
+def test_stale_caches_are_removed(tmp_path, data_paths, clean_calls) -> None:
+    """Writing the cache for a new key removes the cache files of every other key, and leaves other files alone"""
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    for file_name in ['0123456789abcdef_airports.pkl', '0123456789abcdef_routes.pkl', 'notes.txt']:
+        (cache_dir / file_name).write_text('stale')
+
+    airports_data.load_data(*data_paths, cache_dir=str(cache_dir))
+    key = airports_data._cache_key(data_paths)
+    assert _cache_files(cache_dir) == [f'{key}_airports.pkl', f'{key}_routes.pkl', 'notes.txt']
+
+
+def test_unwritable_cache_still_returns_data(tmp_path, data_paths, clean_calls) -> None:
+    """If the cache directory cannot be created, the cleaned data is returned anyway"""
+    blocker = tmp_path / 'cache'
+    blocker.write_text('a file where the cache directory should be')
+
+    airports_df, routes_df = airports_data.load_data(*data_paths, cache_dir=str(blocker / 'cache'))
+    assert len(clean_calls) == 1
+    assert airports_df['Airport ID'].tolist() == [1, 2]
+    assert len(routes_df) == 1
@@ -0,0 +1,109 @@
+"""Tests for the graph ADT in main.py"""
+
+import random
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from main import Airport, AirportsGraph
+
+
+def _reference_to_networkx(graph: AirportsGraph, max_vertices: int) -> tuple[dict, dict]:
+    """Return the (nodes, edges) that AirportsGraph.to_networkx should build, found by looping over each vertex.
+
+    The nodes are the first max_vertices distinct airport names in vertex order, each mapped to the attributes of the
+    last airport with that name. The edges map each pair of node names to the set of distances of the routes
+    between airports with those names, since any one of them may become the weight of the merged edge.
+    """
+    airports = list(graph)
+    top_names = []
+    for v in airports:
+        if v.name not in top_names and len(top_names) < max_vertices:
+            top_names.append(v.name)
+
+    nodes = {}
+    for v in airports:
+        if v.name in top_names:
+            nodes[v.name] = {
+                'latitude': v.coordinates[0],
+                'longitude': v.coordinates[1],
+                'id': v.id,
+                'global_piece_index': v.global_peace_index,
+                'country': v.country,
+            }
+
+    airports_by_id = {v.id: v for v in airports}
+    edges = {}
+    for v in airports:
+        for u_id in graph.get_neighbours(v.id):
+            u = airports_by_id[u_id]
+            if v.name in nodes and u.name in nodes:
+                edges.setdefault(frozenset([v.name, u.name]), set()).add(graph.get_distance(v.id, u.id))
+
+    return nodes, edges
+
+
+def _random_graph(seed: int, num_airports: int, num_edges: int) -> AirportsGraph:
+    """Return a random graph whose airports often share names, so that several airports map to one networkx node"""
+    rng = random.Random(seed)
+    countries = {'Canada': 1.4, 'Japan': 1.3, 'Chile': 1.9}
+    graph = AirportsGraph()
+    for airport_id in rng.sample(range(1, 10 * num_airports), num_airports):
+        country = rng.choice(list(countries))
+        graph.add_vertex(Airport(
+            airport_id,
+            f'Airport {rng.randrange(num_airports // 2 + 1)}',
+            'City',
+            country,
+            (rng.uniform(-80, 80), rng.uniform(-180, 180)),
+            'America/Toronto',
+            countries[country],
+        ))
+
+    ids = [airport.id for airport in graph]
+    sources, destinations = [], []
+    for _ in range(num_edges):
+        source, destination = rng.sample(ids, 2)
+        sources.append(source)
+        destinations.append(destination)
+    graph.add_edges(np.array(sources), np.array(destinations))
+    return graph
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_to_networkx_matches_vertex_loop(seed: int) -> None:
+    """to_networkx keeps the first max_vertices airport names and the routes between them, for every possible
+    max_vertices"""
+    graph = _random_graph(seed, num_airports=40, num_edges=70)
+    for max_vertices in range(-1, len(graph) + 2):
+        graph_nx = graph.to_networkx(max_vertices)
+        expected_nodes, expected_edges = _reference_to_networkx(graph, max_vertices)
+        assert dict(graph_nx.nodes(data=True)) == expected_nodes
+
+        actual_edges = {frozenset([u, v]): data['weight'] for u, v, data in graph_nx.edges(data=True)}
+        assert actual_edges.keys() == expected_edges.keys()
+        assert all(actual_edges[edge] in expected_edges[edge] for edge in actual_edges)
+
+
+def test_rank_airports_orders_countries_by_gpi_and_airports_by_degree() -> None:
+    """Airports are grouped by country, most connected first, with countries in increasing Global Peace Index order,
+    and the result is cut to max_out_size"""
+    graph = AirportsGraph()
+    for airport_id, country, gpi in [
+        (1, 'Austria', 1.5), (2, 'Austria', 1.5), (3, 'Austria', 1.5),
+        (4, 'Iceland', 1.1), (5, 'Iceland', 1.1),
+        (6, 'Chile', 1.9), (7, 'Chile', 1.9),
+    ]:
+        graph.add_vertex(Airport(airport_id, f'Airport {airport_id}', 'City', country, (0.0, airport_id / 10),
+                                 'Europe/Vienna', gpi))
+
+    # Degrees: 1 -> 1, 2 -> 3, 3 -> 2, 4 -> 1, 5 -> 2, 6 -> 1, 7 -> 4
+    for source_id, destination_id in [(2, 7), (2, 6), (2, 4), (3, 7), (3, 5), (1, 7), (5, 7)]:
+        graph.add_edge(source_id, destination_id)
+
+    given = {1, 2, 3, 4, 5, 6}
+    assert graph.rank_airports(given, 10) == [5, 4, 2, 3, 1, 6]
+    assert graph.rank_airports(given, 5) == [5, 4, 2, 3, 1]
+    assert graph.rank_airports(given, 3) == [5, 4, 2]
+    assert graph.rank_airports({1, 3, 6}, 2) == [3, 1]
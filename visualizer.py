@@ -1,106 +1,129 @@
 """Visualizer for our graph"""
 
-from typing import Any
+from itertools import islice
+from typing import Any, Optional
 
 import dash
+import networkx as nx
+import numpy as np
 import plotly.graph_objects as go
-import plotly.io as plo
-from dash import Input, Output, State, ctx, dcc, html
+from dash import Input, Output, Patch, State, ctx, dcc, html, no_update
 
 import main
 
-plo.renderers.default = 'browser'
+# The map view both visualizers open on
+MAP_LAYOUT = {
+    'center': {'lon': 10, 'lat': 10},
+    'style': 'open-street-map',
+    'zoom': 1,
+}
 
+# The most airports the interactive app lists for one search
+MAX_SEARCH_RESULTS = 20
 
-def visualize_graph_app(graph: main.AirportsGraph, max_vertices: int = 100) -> None:
-    """Interactive Graph Visualizer"""
-    graph_nx = graph.to_networkx(max_vertices)
+# The most edges the interactive app labels with their distances by default
+MAX_LABELLED_EDGES = 500
 
-    node_traces = []
-    for node in graph_nx.nodes:
-        lat1 = graph_nx.nodes[node]['latitude']
-        lon1 = graph_nx.nodes[node]['longitude']
-        id1 = graph_nx.nodes[node]['id']
-        country1 = graph_nx.nodes[node]['country']
 
-        node_trace = go.Scattermap(
-            mode='markers',
-            lon=[lon1],
-            lat=[lat1],
-            text=[node],
-            name=country1,
-            marker={'size': 4, 'color': 'black'},
-            ids=[id1],
-        )
-        node_traces.append(node_trace)
-
-    edge_traces = []
-    text_traces = []
-    for edge in graph_nx.edges(data=True):
-        node1 = edge[0]
-        node2 = edge[1]
-        lat1, lon1 = (
-            graph_nx.nodes[node1]['latitude'],
-            graph_nx.nodes[node1]['longitude'],
-        )
-        lat2, lon2 = (
-            graph_nx.nodes[node2]['latitude'],
-            graph_nx.nodes[node2]['longitude'],
-        )
+def visualize_graph_app(
+    graph: main.AirportsGraph, max_vertices: int = 100, show_edge_labels: Optional[bool] = None
+) -> None:
+    """Interactive Graph Visualizer
 
-        edge_trace = go.Scattermap(
-            mode='lines+text',
-            lon=[lon1, lon2, None],
-            lat=[lat1, lat2, None],
-            line={'width': 2, 'color': 'rgba(0, 0, 0, 0.1)'},
-        )
-        edge_traces.append(edge_trace)
-
-        # Compute the midpoint coordinates for the label
-        mid_lon = (lon1 + lon2) / 2
-        mid_lat = (lat1 + lat2) / 2
-
-        # Create a separate trace to display the distance label at the midpoint
-        text_trace = go.Scattermap(
-            mode='text',
-            lon=[mid_lon],
-            lat=[mid_lat],
-            text=[str(edge[2]['weight']) + 'km'],
-            textposition='middle center',
-            hoverinfo='none',
-            showlegend=False,
-            textfont={'size': 8},
-        )
-        text_traces.append(text_trace)
+    show_edge_labels specifies whether each edge is labelled with its distance. By default, edges are
+    labelled only when there are at most MAX_LABELLED_EDGES of them.
+    """
+    graph_nx = graph.to_networkx(max_vertices)
 
-    fig = go.Figure(data=edge_traces + node_traces + text_traces)
-    fig.update_layout(
-        margin={'l': 0, 't': 0, 'b': 0, 'r': 0},
-        showlegend=False,
-        uirevision='constant',
-        map={
-            'center': {'lon': 10, 'lat': 10},
-            'style': 'open-street-map',
-            'zoom': 1,
+    # Every airport is a point of one marker trace, so the figure does not carry a trace per airport
+    texts = []
+    ids = []
+    countries = []
+    lats = []
+    lons = []
+    for node, data in graph_nx.nodes(data=True):
+        texts.append(node)
+        ids.append(data['id'])
+        countries.append(data['country'])
+        lats.append(data['latitude'])
+        lons.append(data['longitude'])
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    node_trace = {
+        'type': 'scattermap',
+        'mode': 'markers',
+        'lon': lons,
+        'lat': lats,
+        'text': texts,
+        'customdata': countries,
+        'hovertemplate': '%{text}<extra>%{customdata}</extra>',
+        # One size and colour per point, so that a single point can be restyled
+        'marker': {'size': [4] * len(texts), 'color': ['black'] * len(texts)},
+        'ids': ids,
+    }
+
+    # All edges form one line trace, and all distance labels one text trace
+    edge_ends, edge_lats, edge_lons = _edge_coordinates(graph_nx, lats, lons)
+
+    edge_trace = {
+        'type': 'scattermap',
+        'mode': 'lines',
+        'lon': edge_lons,
+        'lat': edge_lats,
+        'line': {'width': 2, 'color': 'rgba(0, 0, 0, 0.1)'},
+        'hoverinfo': 'skip',
+    }
+
+    traces = [edge_trace, node_trace]
+    if show_edge_labels is None:
+        show_edge_labels = graph_nx.number_of_edges() <= MAX_LABELLED_EDGES
+    if show_edge_labels:
+        # Compute the midpoint coordinates for the labels
+        mid_lats = (lats[edge_ends[:, 0]] + lats[edge_ends[:, 1]]) / 2
+        mid_lons = (lons[edge_ends[:, 0]] + lons[edge_ends[:, 1]]) / 2
+        labels = [str(weight) + 'km' for _, _, weight in graph_nx.edges(data='weight')]
+
+        # Display each distance label at the midpoint of its edge
+        text_trace = {
+            'type': 'scattermap',
+            'mode': 'text',
+            'lon': mid_lons,
+            'lat': mid_lats,
+            'text': labels,
+            'textposition': 'middle center',
+            'hoverinfo': 'skip',
+            'showlegend': False,
+            'textfont': {'size': 8},
+        }
+        traces.append(text_trace)
+
+    # A plain dict figure is passed straight to dcc.Graph, skipping the plotly.py property validation
+    fig = {
+        'data': traces,
+        'layout': {
+            'margin': {'l': 0, 't': 0, 'b': 0, 'r': 0},
+            'showlegend': False,
+            'uirevision': 'constant',
+            'map': MAP_LAYOUT,
+            'title': {'text': 'Airports Network Visualization'},
         },
-        title='Airports Network Visualization',
-    )
+    }
 
-    node_data_map = {}
-    for i, data in enumerate(fig.data):
-        if data not in edge_traces and data not in text_traces and data.text:
-            node_data_map[data.text[0]] = i
+    node_trace_index = 1
+    node_data_map = {node_name: i for i, node_name in enumerate(texts)}
 
-    def change_node_marker(node_name: str, marker_data: dict[str, Any]) -> go.Figure:
-        """Highlight the chosen vertex"""
+    def change_node_marker(
+        node_name: str, marker_data: dict[str, Any], patched_fig: Patch
+    ) -> None:
+        """Highlight the chosen vertex and record the change in patched_fig"""
         index = node_data_map.get(node_name)
         if index is not None:
-            fig.data[index].marker = marker_data
-            return fig
-        return fig
+            patched_fig['data'][node_trace_index]['marker']['color'][index] = marker_data['color']
+            patched_fig['data'][node_trace_index]['marker']['size'][index] = marker_data['size']
 
     # Dash App
-    app = dash.Dash(__name__)
+    app = dash.Dash(__name__, update_title=None)
 
     app.layout = html.Div(
         style={
@@ -140,6 +163,7 @@ def visualize_graph_app(graph: main.AirportsGraph, max_vertices: int = 100) -> N
                                 id='my-input',
                                 value='1000',
                                 type='text',
+                                debounce=True,
                                 style={
                                     'width': '150px',
                                     'padding': '5px',
@@ -211,6 +235,8 @@ def visualize_graph_app(graph: main.AirportsGraph, max_vertices: int = 100) -> N
                             'color': 'green',
                         },
                     ),
+                    # The [id, name] of each selected airport, kept in the browser so every user has their own
+                    dcc.Store(id='selected-airports', data=[]),
                 ],
                 style={
                     'display': 'flex',
@@ -221,24 +247,20 @@ def visualize_graph_app(graph: main.AirportsGraph, max_vertices: int = 100) -> N
         ],
     )
 
-    # Map the node id to their names
-    clicked_nodes = {}
-
-    # Function output
-    # This list will be edited in the function ONLY where it is supposed to be edited
-    # It is used to store the outputs of previous callbacks of the function and update the webpage
-    # without losing previous data
-    output = ['', '', fig]
+    # Each node name with its lowercase form, for searching
+    lower_node_names = [(node, node.lower()) for node in graph_nx.nodes]
 
     @app.callback(
         Output('output', 'children'),
         Output('search-output', 'children'),
         Output('world-graph', 'figure'),
+        Output('selected-airports', 'data'),
         Input('world-graph', 'clickData'),
         Input('my-input', 'value'),
         Input('search-input', 'n_submit'),
         State('search-input', 'value'),
         Input('submit-button-state', 'n_clicks'),
+        State('selected-airports', 'data'),
         prevent_initial_call=True,
     )
     def display_click(
@@ -247,14 +269,15 @@ def visualize_graph_app(graph: main.AirportsGraph, max_vertices: int = 100) -> N
         _unused_n_submit: Any,
         search_input: Any,
         _unused_button_state: Any,
-    ) -> tuple[str, str, go.Figure]:
-        """Display the change(s) on the webpage based on any input"""
+        selected: list[list],
+    ) -> tuple[Any, Any, Any, Any]:
+        """Display the change(s) on the webpage based on any input. Outputs that do not change are
+        returned as no_update, so the page keeps showing their previous values."""
         if ctx.triggered_id == 'submit-button-state':
-            if len(clicked_nodes) == 0:
-                output[0] = 'Please select an airport'
-                return output[0], output[1], output[2]
+            if len(selected) == 0:
+                return 'Please select an airport', no_update, no_update, no_update
 
-            id_list = list(clicked_nodes.keys())
+            id_list = [node_id for node_id, _ in selected]
 
             close_airport_ids = main.AirportsGraph.get_close_airports_adjacent(
                 graph, id_list, int(max_distance)
@@ -265,69 +288,67 @@ def visualize_graph_app(graph: main.AirportsGraph, max_vertices: int = 100) -> N
             rank_airport_names = graph.get_airport_names_from_id(rank_airport_ids)
 
             res = ', '.join(rank_airport_names)
+            patched_fig = Patch()
             # Reset clicked nodes
-            for node_id in clicked_nodes:
-                change_node_marker(
-                    clicked_nodes[node_id], {'color': 'black', 'size': 4}
-                )
-            clicked_nodes.clear()
+            for _, node_name in selected:
+                change_node_marker(node_name, {'color': 'black', 'size': 4}, patched_fig)
             # Highlight the output nodes
-            for name in rank_airport_names:
-                if name not in clicked_nodes.values():
-                    clicked_nodes[graph.get_airport_id_from_names([name])[0]] = name
-                    change_node_marker(name, {'color': 'green', 'size': 10})
+            # Airports sharing a name share a node, so each name is selected once, as its best ranked airport
+            highlighted = {}
+            for node_id, name in zip(rank_airport_ids, rank_airport_names):
+                highlighted.setdefault(name, node_id)
+            for name in highlighted:
+                change_node_marker(name, {'color': 'green', 'size': 10}, patched_fig)
 
-            output[0] = f'Closest airports: {res}'
-            return output[0], output[1], output[2]
+            selected = [[node_id, name] for name, node_id in highlighted.items()]
+            return f'Closest airports: {res}', no_update, patched_fig, selected
 
         elif ctx.triggered_id == 'world-graph':
             if not clickdata or 'points' not in clickdata:
-                return output[0], output[1], output[2]
+                return no_update, no_update, no_update, no_update
 
             point = clickdata['points'][0]
             node_name = point['text']
             if not point.get('id'):
-                return (output[0], output[1], output[2])
-            node_id = point['id']
+                return no_update, no_update, no_update, no_update
+            node_id = int(point['id'])
 
             if node_name not in graph_nx.nodes:
-                return output[0], output[1], output[2]
+                return no_update, no_update, no_update, no_update
 
-            if node_id in clicked_nodes:
+            patched_fig = Patch()
+            remaining = [pair for pair in selected if pair[0] != node_id]
+            if len(remaining) < len(selected):
                 # Unselect the node
-                del clicked_nodes[node_id]
-                change_node_marker(node_name, {'color': 'black', 'size': 4})
+                selected = remaining
+                change_node_marker(node_name, {'color': 'black', 'size': 4}, patched_fig)
             else:
                 # Add clicked node to list
-                clicked_nodes[node_id] = node_name
-                change_node_marker(node_name, {'color': 'blue', 'size': 10})
-
-            result = ', '.join(clicked_nodes.values())
+                selected = selected + [[node_id, node_name]]
+                change_node_marker(node_name, {'color': 'blue', 'size': 10}, patched_fig)
 
-            output[0] = f'Selected node(s): {result}'
-            return output[0], output[1], output[2]
+            result = ', '.join(name for _, name in selected)
+            return f'Selected node(s): {result}', no_update, patched_fig, selected
 
         elif ctx.triggered_id == 'my-input':
-            result = ', '.join(clicked_nodes.values())
-
-            output[0] = f'Selected node(s): {result}'
-            return output[0], output[1], output[2]
+            result = ', '.join(name for _, name in selected)
+            return f'Selected node(s): {result}', no_update, no_update, no_update
 
         elif ctx.triggered_id == 'search-input':
             if search_input:
-                possibles = set()
-                for curr_node in graph_nx.nodes:
-                    if search_input.lower() in curr_node.lower():
-                        possibles.add(curr_node)
+                query = search_input.lower()
+                # Stop scanning once there are enough matches to show
+                possibles = list(islice(
+                    (curr_node for curr_node, lower_name in lower_node_names if query in lower_name),
+                    MAX_SEARCH_RESULTS,
+                ))
                 if len(possibles) == 0:
-                    output[1] = 'No airports found'
-                    return output[0], output[1], output[2]
+                    return no_update, 'No airports found', no_update, no_update
                 else:
                     result = ', '.join(possibles)
-                    output[1] = f'Possible airports: {result}'
-                    return output[0], output[1], output[2]
+                    return no_update, f'Possible airports: {result}', no_update, no_update
 
-        return output[0], output[1], output[2]
+        return no_update, no_update, no_update, no_update
 
     app.run()
 
@@ -336,46 +357,20 @@ def visualize_graph(graph: main.AirportsGraph, max_vertices: int = 7000):
     """Visualize airports and connections on a map"""
     graph_nx = graph.to_networkx(max_vertices)
 
-    latitudes = []
-    longitudes = []
-    node_names = []
-    degrees = []
-    degree_size = []
-
-    for node in graph_nx.nodes:
-        lat = graph_nx.nodes[node]['latitude']
-        lon = graph_nx.nodes[node]['longitude']
-        global_piece_index = graph_nx.nodes[node]['global_piece_index']
-        country = graph_nx.nodes[node]['country']
-
-        latitudes.append(lat)
-        longitudes.append(lon)
-        node_names.append(
-            f'Name: {node} | Country: {country} | Global Piece Index: {global_piece_index}'
-        )
-
-        vertex_degree = graph_nx.degree(node)
+    num_nodes = len(graph_nx)
+    nodes = graph_nx.nodes
+    latitudes = np.fromiter((lat for _, lat in nodes.data('latitude')), dtype=np.float64, count=num_nodes)
+    longitudes = np.fromiter((lon for _, lon in nodes.data('longitude')), dtype=np.float64, count=num_nodes)
+    node_names = [
+        f"Name: {node} | Country: {data['country']} | Global Piece Index: {data['global_piece_index']}"
+        for node, data in nodes(data=True)
+    ]
+    degrees = np.fromiter((degree for _, degree in graph_nx.degree()), dtype=np.int64, count=num_nodes)
 
-        degrees.append(vertex_degree)
+    # Our scaling factor which is bounded above by size 20. Max size is 20, min size is 5.
+    degree_size = 26 - 2000 / (degrees + 100)
 
-        # Our scaling factor which is bounded above by size 20. Max size is 20, min size is 5.
-        degree_size.append(26 - 2000 / (vertex_degree + 100))
-
-    edge_lons = []
-    edge_lats = []
-    for edge in graph_nx.edges(data=True):
-        node1, node2 = edge[0], edge[1]
-        lat1, lon1 = (
-            graph_nx.nodes[node1]['latitude'],
-            graph_nx.nodes[node1]['longitude'],
-        )
-        lat2, lon2 = (
-            graph_nx.nodes[node2]['latitude'],
-            graph_nx.nodes[node2]['longitude'],
-        )
-        # None separates the line segments
-        edge_lats.extend([lat1, lat2, None])
-        edge_lons.extend([lon1, lon2, None])
+    _, edge_lats, edge_lons = _edge_coordinates(graph_nx, latitudes, longitudes)
 
     fig = go.Figure(
         go.Scattermap(
@@ -385,6 +380,7 @@ def visualize_graph(graph: main.AirportsGraph, max_vertices: int = 7000):
             line={'color': '#76c893', 'width': 2},
             name='Airport Connections',
             opacity=0.2,
+            hoverinfo='skip',
         )
     )
 
@@ -417,11 +413,29 @@ def visualize_graph(graph: main.AirportsGraph, max_vertices: int = 7000):
     fig.update_layout(
         margin={'l': 0, 't': 30, 'b': 0, 'r': 0},
         uirevision='constant',
-        map={
-            'center': {'lon': 10, 'lat': 10},
-            'style': 'open-street-map',
-            'zoom': 1,
-        },
+        map=MAP_LAYOUT,
         title='Airports Network Visualization',
     )
-    fig.show()
+    fig.show(renderer='browser')
+
+
+def _edge_coordinates(
+    graph_nx: nx.Graph, latitudes: np.ndarray, longitudes: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return the node indices of both ends of every edge in graph_nx, followed by the latitudes and
+    longitudes of the edges as line segments separated by NaN, the same as None.
+
+    Preconditions:
+        - latitudes[i] and longitudes[i] are the coordinates of the i-th node of graph_nx
+    """
+    node_indices = {node: i for i, node in enumerate(graph_nx.nodes)}
+    edge_ends = np.array(
+        [(node_indices[node1], node_indices[node2]) for node1, node2 in graph_nx.edges],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+
+    edge_lats = np.full(3 * len(edge_ends), np.nan)
+    edge_lons = np.full(3 * len(edge_ends), np.nan)
+    edge_lats[0::3], edge_lats[1::3] = latitudes[edge_ends.T]
+    edge_lons[0::3], edge_lons[1::3] = longitudes[edge_ends.T]
+    return edge_ends, edge_lats, edge_lons